@@ -1,9 +1,11 @@
-import pandas as pd
 import numpy as np
 import joblib
-import traceback
+import logging
 import os
 import sys
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 
 def get_script_directory():
     """Get the directory where the current script is located"""
@@ -13,112 +15,397 @@ def get_script_directory():
         # Fallback if __file__ is not available
         return os.getcwd()
 
-def predict_band_gap(input_formula):
+logger = logging.getLogger(__name__)
+
+# Artifact paths are resolved once at import
+_SCRIPT_DIR = get_script_directory()
+_PATHS = {name: os.path.join(_SCRIPT_DIR, name)
+          for name in ('bandgap_model.joblib', 'scaler.joblib', 'feature_columns.joblib')}
+# Optional ONNX export of the model (see export_onnx.py)
+_ONNX_PATH = os.path.join(_SCRIPT_DIR, 'bandgap_model.onnx')
+# Optional compiled forest (see export_treelite.py)
+_TL_PATH = os.path.join(_SCRIPT_DIR, 'bandgap_rf.so')
+
+# Artifacts loaded once on first use and reused across calls
+_MODEL = None
+_COLS = None
+_FEATURIZER = None
+_COMPOSITION = None
+_PERM = None
+_MEAN = None
+_INV = None
+_FOREST = None
+_SESS = None
+_TL = None
+_LOAD_LOCK = threading.Lock()
+# numba's default workqueue threading layer aborts if two threads enter a parallel region
+# at once, and the REPL warm-up thread runs the kernel alongside the first prediction
+_KERNEL_LOCK = threading.Lock()
+# Featurization workers for batch mode; leave one core for the main process
+_N_JOBS = max(1, (os.cpu_count() or 1) - 1)
+# Workers have to import matminer/pymatgen, so small batches are featurized serially
+_MIN_ROWS_PER_WORKER = 256
+# Parallel object held open by featurization_pool(), reused by _featurize_many
+_POOL = None
+# Opt-in float16 thresholds for the numba forest path. Rounding the input row can change
+# splits, so the load-time check may reject it and fall back to model.predict.
+_FP16 = os.environ.get('BANDGAP_FP16') == '1'
+
+def _load_once():
+    """Load the model, scaler, feature list and featurizer once and cache them
+    
+    Raises FileNotFoundError / ImportError with a readable message when something is missing.
+    """
+    if _MODEL is not None:
+        return
+    # The REPL warms up in a background thread, so make sure only one caller loads
+    with _LOAD_LOCK:
+        if _MODEL is None:
+            _load_artifacts()
+
+def _load_artifacts():
+    global _MODEL, _COLS, _FEATURIZER, _COMPOSITION, _PERM, _MEAN, _INV, _FOREST, _SESS, _TL
+    
+    # Check if model files exist (only ever runs on the first call)
+    missing_files = [name for name, path in _PATHS.items() if not os.path.exists(path)]
+    if missing_files:
+        raise FileNotFoundError(
+            f"Missing files {missing_files} in {_SCRIPT_DIR}. "
+            "Please make sure the files are in the same directory as this script.")
+    
+    # Import required libraries for formula conversion
     try:
-        # Get the script directory for reliable file paths
-        script_dir = get_script_directory()
-        
-        # Check if model files exist with full paths
-        required_files = ['bandgap_model.joblib', 'scaler.joblib', 'feature_columns.joblib']
-        missing_files = []
-        
-        for file in required_files:
-            file_path = os.path.join(script_dir, file)
-            if not os.path.exists(file_path):
-                missing_files.append(file)
-                print(f"Error: Required file '{file}' not found at: {file_path}")
-        
-        if missing_files:
-            print(f"Missing files: {missing_files}")
-            print(f"Current working directory: {os.getcwd()}")
-            print(f"Script directory: {script_dir}")
-            print(f"Files in script directory: {os.listdir(script_dir)}")
-            print("Please make sure the files are in the same directory as this script.")
+        from pymatgen.core import Composition
+        from matminer.featurizers.composition import ElementProperty
+    except ImportError as e:
+        raise ImportError(f"Matminer package not found. Please install with 'pip install matminer' ({e})")
+    
+    # Load the model, scaler, and feature columns.
+    # Arrays are memory-mapped read-only, so anything mutated later must be copied first.
+    model = joblib.load(_PATHS['bandgap_model.joblib'], mmap_mode='r')
+    scaler = joblib.load(_PATHS['scaler.joblib'], mmap_mode='r')
+    feature_columns = joblib.load(_PATHS['feature_columns.joblib'], mmap_mode='r')
+    logger.debug("Model, scaler, and feature list loaded successfully")
+    
+    featurizer = ElementProperty.from_preset("magpie")
+    # Batches are split across joblib workers, so each worker featurizes serially
+    featurizer.set_n_jobs(1)
+    
+    _COLS = feature_columns
+    _FEATURIZER = featurizer
+    _COMPOSITION = Composition
+    # Position of each training feature column in the featurizer output (-1 if absent)
+    label_to_idx = {lbl: i for i, lbl in enumerate(featurizer.feature_labels())}
+    _PERM = np.array([label_to_idx.get(c, -1) for c in feature_columns], dtype=np.int64)
+    # StandardScaler as a plain affine transform: (x - mean) * (1 / scale)
+    n_features = len(feature_columns)
+    if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None:
+        _MEAN = np.array(scaler.mean_, dtype=np.float64)
+    else:
+        _MEAN = np.zeros(n_features)
+    if getattr(scaler, 'with_std', True) and scaler.scale_ is not None:
+        _INV = 1.0 / np.array(scaler.scale_, dtype=np.float64)
+    else:
+        _INV = np.ones(n_features)
+    _TL = _load_treelite_predictor(model)
+    _SESS = _load_onnx_session(model) if _TL is None else None
+    # The numba forest only stands in for model.predict, so skip it when a compiled backend serves predictions
+    _FOREST = _check_forest(_build_forest_arrays(model), model) if _TL is None and _SESS is None else None
+    # Set last so a partially failed load is retried on the next call
+    _MODEL = model
+
+def _round_down(a, dtype):
+    """Largest dtype value <= each value, so dtype x <= result exactly when x <= a"""
+    out = a.astype(dtype)
+    over = out.astype(np.float64) > a
+    out[over] = np.nextafter(out[over], dtype(-np.inf))
+    return out
+
+def _fp16_supported(kernel):
+    """Whether numba can compile the forest kernel for float16 inputs on this machine"""
+    try:
+        x = np.zeros(1, dtype=np.float16)
+        nodes = np.full((1, 1), -1, dtype=np.int32)
+        kernel(x, np.zeros((1, 1), dtype=np.int32), np.zeros((1, 1), dtype=np.float16),
+               nodes, nodes, np.zeros((1, 1), dtype=np.float32))
+        return True
+    except Exception as e:
+        logger.info("float16 forest kernel unavailable, using float32: %s", e)
+        return False
+
+def _build_forest_arrays(model):
+    """Pack the trees of a random forest regressor into padded (n_trees, max_nodes) arrays
+    
+    Returns (kernel, input dtype, arrays), or None when numba is unavailable or the model is not a
+    plain averaging forest, in which case predictions fall back to model.predict.
+    """
+    # numba is optional and slow to import, so only pull it in here
+    try:
+        from rf_kernel import rf_predict
+    except ImportError:
+        return None
+    try:
+        from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor
+        if not isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)) or model.n_outputs_ != 1:
             return None
         
-        # Load the model, scaler, and feature columns with full paths
-        try:
-            model = joblib.load(os.path.join(script_dir, 'bandgap_model.joblib'))
-            scaler = joblib.load(os.path.join(script_dir, 'scaler.joblib'))
-            feature_columns = joblib.load(os.path.join(script_dir, 'feature_columns.joblib'))
-            print("Model, scaler, and feature list loaded successfully")
-        except Exception as e:
-            print(f"Error loading model files: {e}")
-            print(f"Detailed error: {traceback.format_exc()}")
+        dtype = np.float16 if _FP16 and _fp16_supported(rf_predict) else np.float32
+        trees = [est.tree_ for est in model.estimators_]
+        n_trees = len(trees)
+        max_nodes = max(t.node_count for t in trees)
+        feat = np.zeros((n_trees, max_nodes), dtype=np.int32)
+        thr = np.zeros((n_trees, max_nodes), dtype=dtype)
+        # Padding nodes are marked as leaves and are never reached
+        cl = np.full((n_trees, max_nodes), -1, dtype=np.int32)
+        cr = np.full((n_trees, max_nodes), -1, dtype=np.int32)
+        val = np.zeros((n_trees, max_nodes), dtype=np.float32)
+        for i, t in enumerate(trees):
+            n = t.node_count
+            feat[i, :n] = t.feature
+            thr[i, :n] = _round_down(t.threshold, dtype)
+            cl[i, :n] = t.children_left
+            cr[i, :n] = t.children_right
+            val[i, :n] = t.value[:, 0, 0]
+        return rf_predict, dtype, (feat, thr, cl, cr, val)
+    except Exception as e:
+        logger.info("Falling back to model.predict: %s", e)
+        return None
+
+def _run_forest(forest, x):
+    # sklearn also evaluates splits on float32 features, so the float32 path keeps identical splits
+    kernel, dtype, arrays = forest
+    x = x.astype(dtype)
+    with _KERNEL_LOCK:
+        return kernel(x, *arrays)
+
+# Formulas used to check optional backends against model.predict at load time
+_CHECK_FORMULAS = ('NaCl', 'GaAs', 'Si', 'TiO2', 'ZnO', 'Fe2O3', 'Al2O3', 'CsPbI3')
+
+def _agrees_with_model(name, predict, model, atol):
+    """Whether predict(X) reproduces model.predict on the check formulas within atol eV"""
+    vals = np.array([_FEATURIZER.featurize(_COMPOSITION(f)) for f in _CHECK_FORMULAS], dtype=np.float64)
+    X = _scale_features(vals[~np.isnan(vals).any(axis=1)])
+    expected = model.predict(X)
+    got = np.asarray(predict(X))
+    if not np.allclose(got, expected, rtol=0, atol=atol):
+        logger.warning("%s disagrees with model.predict (max diff %.3g), not using it",
+                       name, np.abs(got - expected).max())
+        return False
+    return True
+
+def _check_forest(forest, model):
+    """Return forest only if it reproduces model.predict on a few known formulas"""
+    if forest is None:
+        return None
+    try:
+        predict = lambda X: [_run_forest(forest, row) for row in X]
+        return forest if _agrees_with_model("numba forest", predict, model, atol=1e-5) else None
+    except Exception as e:
+        logger.info("Falling back to model.predict: %s", e)
+        return None
+
+def _run_onnx(sess, X):
+    input_name = sess.get_inputs()[0].name
+    return sess.run(None, {input_name: X.astype(np.float32)})[0].ravel()
+
+def _load_onnx_session(model):
+    """onnxruntime session for bandgap_model.onnx, or None if it is missing, unusable or stale"""
+    if not os.path.exists(_ONNX_PATH):
+        return None
+    try:
+        import onnxruntime
+        sess = onnxruntime.InferenceSession(_ONNX_PATH, providers=['CPUExecutionProvider'])
+        # ONNX rounds thresholds to float32, which can flip a split in a few trees and shift
+        # the forest mean slightly; an export left over from an older model should differ by more
+        if not _agrees_with_model("ONNX model", lambda X: _run_onnx(sess, X), model, atol=0.02):
             return None
-        
-        # Import required libraries for formula conversion
-        try:
-            from matminer.featurizers.conversions import StrToComposition
-            from matminer.featurizers.composition import ElementProperty
-        except ImportError as e:
-            print("Error: Matminer package not found. Please install with 'pip install matminer'")
-            print(f"Error details: {e}")
+        return sess
+    except Exception as e:
+        logger.info("Falling back to model.predict: %s", e)
+        return None
+
+def _run_treelite(tl, X):
+    dmatrix, predictor, dtype = tl
+    # Round through float32 first, as sklearn does, so splits match model.predict
+    return predictor.predict(dmatrix(X.astype(np.float32).astype(dtype))).ravel()
+
+def _load_treelite_predictor(model):
+    """(DMatrix, predictor, input dtype) for bandgap_rf.so, or None if it is missing, unusable or stale"""
+    if not os.path.exists(_TL_PATH):
+        return None
+    try:
+        import tl2cgen
+        predictor = tl2cgen.Predictor(_TL_PATH, nthread=1)
+        # The DMatrix dtype must match the compiled thresholds (float64 for an sklearn import)
+        dtype = np.dtype(getattr(predictor, 'threshold_type', 'float64'))
+        tl = (tl2cgen.DMatrix, predictor, dtype)
+        if not _agrees_with_model("treelite library", lambda X: _run_treelite(tl, X), model, atol=1e-5):
             return None
-        
-        # Create featurizer
+        return tl
+    except Exception as e:
+        logger.info("Treelite predictor not used: %s", e)
+        return None
+
+def _predict_rows(X_input_scaled):
+    """Predict scaled rows (N, n_features) with the fastest available backend
+    
+    Order: compiled treelite library, onnxruntime, then the sklearn model. Single rows
+    use the same backend (see _predict), so batch and single predictions agree.
+    """
+    if _TL is not None:
+        return _run_treelite(_TL, X_input_scaled)
+    if _SESS is None:
+        return _MODEL.predict(X_input_scaled)
+    return _run_onnx(_SESS, X_input_scaled)
+
+def _predict(X_input_scaled):
+    """Predict a single scaled row
+    
+    Uses the same backend as _predict_rows when treelite or ONNX is loaded. Otherwise the
+    numba forest stands in for model.predict, which it was checked against at load time.
+    """
+    # The kernel has no missing-value handling (tree_.missing_go_to_left), so leave NaN to sklearn
+    if _FOREST is None or np.isnan(X_input_scaled).any():
+        return _predict_rows(X_input_scaled)[0]
+    return _run_forest(_FOREST, X_input_scaled[0])
+
+def _scale_features(vals):
+    """Map raw featurizer rows (N, n_labels) onto the scaled training columns (N, n_features)"""
+    X = np.zeros((vals.shape[0], len(_COLS)))
+    mask = _PERM >= 0
+    X[:, mask] = vals[:, _PERM[mask]]
+    
+    # Scale input features in place using the saved scaler parameters
+    np.subtract(X, _MEAN, out=X)
+    np.multiply(X, _INV, out=X)
+    return X
+
+@contextmanager
+def featurization_pool(n_jobs=None):
+    """Keep one set of featurization workers alive for repeated predict_band_gaps calls
+    
+    Usage:
+        with featurization_pool():
+            for chunk in chunks:
+                predict_band_gaps(chunk)
+    """
+    global _POOL
+    n_jobs = n_jobs or _N_JOBS
+    previous = _POOL
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        _POOL = (parallel, n_jobs)
         try:
-            featurizer = ElementProperty.from_preset("magpie")
-        except Exception as e:
-            print(f"Error creating featurizer: {e}")
-            print(f"Detailed error: {traceback.format_exc()}")
-            return None
+            yield
+        finally:
+            _POOL = previous
+
+def _parse_formula(formula):
+    try:
+        return _COMPOSITION(formula)
+    except Exception:
+        return None
+
+def _featurize_chunk(featurizer, comps):
+    return featurizer.featurize_many(comps, ignore_errors=True, pbar=False)
+
+def _featurize_many(comps):
+    """Featurize compositions across joblib workers; failed rows come back as NaN"""
+    parallel, n_jobs = _POOL if _POOL is not None else (None, _N_JOBS)
+    n_chunks = min(n_jobs, len(comps) // _MIN_ROWS_PER_WORKER)
+    if n_chunks <= 1:
+        return np.asarray(_featurize_chunk(_FEATURIZER, comps), dtype=np.float64)
+    
+    chunks = [comps[i::n_chunks] for i in range(n_chunks)]
+    tasks = (joblib.delayed(_featurize_chunk)(_FEATURIZER, chunk) for chunk in chunks)
+    results = parallel(tasks) if parallel is not None else joblib.Parallel(n_jobs=n_chunks)(tasks)
+    
+    # Undo the strided split so rows line up with the input order
+    vals = np.empty((len(comps), len(_FEATURIZER.feature_labels())))
+    for i, rows in enumerate(results):
+        vals[i::n_chunks] = rows
+    return vals
+
+@lru_cache(maxsize=4096)
+def _featurize(formula):
+    """Scaled (1, n_features) row for a formula; repeated formulas are served from the cache"""
+    # Featurize the composition directly, skipping the DataFrame pipeline
+    composition = _COMPOSITION(formula)
+    vals = np.asarray(_FEATURIZER.featurize(composition), dtype=np.float64)
+    # Ensure input has same columns as training features, then scale
+    X = _scale_features(vals.reshape(1, -1))
+    # Cached rows are shared between callers
+    X.flags.writeable = False
+    return X
+
+def predict_band_gaps(formulas):
+    """Predict band gaps for a list of formulas with a single featurize/scale/predict pass
+    
+    Formulas that cannot be parsed or featurized get NaN in the returned array.
+    """
+    try:
+        _load_once()
+        if len(formulas) == 0:
+            return np.empty(0)
         
-        # Prepare input data
-        try:
-            # Create a DataFrame for the input formula
-            input_df = pd.DataFrame({"formula": [input_formula]})
-            
-            # Convert formula to composition
-            str_to_comp = StrToComposition()
-            input_df = str_to_comp.featurize_dataframe(input_df, "formula")
-            
-            # Featurize the composition
-            input_df = featurizer.featurize_dataframe(input_df, "composition", ignore_errors=True)
-            print(f"Input formula '{input_formula}' featurized successfully")
-        except Exception as e:
-            print(f"Error featurizing input formula: {e}")
-            print(f"Detailed error: {traceback.format_exc()}")
-            return None
-            
-        # Prepare feature data
-        try:
-            # Ensure input has same columns as training features
-            X_input = input_df.reindex(columns=feature_columns, fill_value=0)
-            
-            # Scale input features using the saved scaler
-            X_input_scaled = scaler.transform(X_input)
-            print("Features prepared and scaled successfully")
-        except Exception as e:
-            print(f"Error preparing features: {e}")
-            print(f"Detailed error: {traceback.format_exc()}")
-            return None
-            
-        # Make prediction
-        try:
-            predicted_band_gap = model.predict(X_input_scaled)[0]
-            return predicted_band_gap
-            
-        except Exception as e:
-            print(f"Error in prediction: {e}")
-            print(f"Detailed error: {traceback.format_exc()}")
-            return None
-            
+        # Featurize each distinct formula once
+        positions = {}
+        inverse = np.array([positions.setdefault(f, len(positions)) for f in formulas], dtype=np.int64)
+        unique = list(positions)
+        comps = [_parse_formula(f) for f in unique]
+        vals = _featurize_many(comps).reshape(len(comps), -1)
+        valid = ~np.isnan(vals).all(axis=1)
+        logger.debug("%d of %d unique formulas featurized successfully", valid.sum(), len(unique))
+        
+        # Prepare feature data and predict
+        predictions = np.full(len(comps), np.nan)
+        if valid.any():
+            predictions[valid] = _predict_rows(_scale_features(vals[valid]))
+        # Scatter the unique predictions back to the input order
+        return predictions[inverse]
     except Exception as e:
-        print(f"Unexpected error: {e}")
-        print(f"Detailed error: {traceback.format_exc()}")
+        print(f"Error predicting band gaps: {e}")
+        logger.debug("Detailed error", exc_info=True)
         return None
 
+def predict_band_gap(input_formula):
+    try:
+        _load_once()
+        return _predict(_featurize(input_formula))
+    except Exception as e:
+        print(f"Error predicting band gap for '{input_formula}': {e}")
+        logger.debug("Detailed error", exc_info=True)
+        return None
+
+def _warm():
+    """Load artifacts and run one dummy prediction (faulting in tree pages and compiling numba)"""
+    try:
+        _load_once()
+        _predict(np.zeros((1, len(_COLS))))
+    except Exception as e:
+        # predict_band_gap reports the same problem to the user
+        logger.debug("Warm-up failed: %s", e)
+
 # Function to process user input
 def process_user_input():
+    # Show backend fallbacks; BANDGAP_VERBOSE=1 adds tracebacks and progress messages
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.DEBUG if os.environ.get('BANDGAP_VERBOSE') == '1' else logging.INFO)
+    
+    # Line editing and history for input(); not available on every platform
+    try:
+        import readline
+    except ImportError:
+        pass
+    
+    # Warm up while the user is typing the first formula
+    threading.Thread(target=_warm, daemon=True).start()
+    
     print("\nBand Gap Prediction Tool")
     print("------------------------")
     
     # Debug information
-    script_dir = get_script_directory()
-    print(f"Script directory: {script_dir}")
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Files available: {os.listdir(script_dir)}")
+    logger.debug("Script directory: %s", _SCRIPT_DIR)
+    logger.debug("Current working directory: %s", os.getcwd())
     
     while True:
         formula = input("\nEnter a chemical formula (or 'exit' to quit): ")
@@ -0,0 +1,17 @@
+import joblib
+import os
+
+# One-time conversion of the trained model to ONNX for serving with onnxruntime.
+# Requires: pip install skl2onnx
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+model = joblib.load(os.path.join(script_dir, 'bandgap_model.joblib'))
+feature_columns = joblib.load(os.path.join(script_dir, 'feature_columns.joblib'))
+
+onx = convert_sklearn(model, initial_types=[('X', FloatTensorType([None, len(feature_columns)]))])
+with open(os.path.join(script_dir, 'bandgap_model.onnx'), 'wb') as f:
+    f.write(onx.SerializeToString())
+print("Model exported to bandgap_model.onnx")
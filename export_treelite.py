@@ -0,0 +1,16 @@
+import joblib
+import os
+
+# One-time compilation of the trained forest into a shared library for tl2cgen.
+# Requires: pip install treelite tl2cgen, and a C compiler (gcc)
+import treelite
+import tl2cgen
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+model = joblib.load(os.path.join(script_dir, 'bandgap_model.joblib'))
+
+tl_model = treelite.sklearn.import_model(model)
+tl2cgen.export_lib(tl_model, toolchain='gcc', libpath=os.path.join(script_dir, 'bandgap_rf.so'),
+                   params={'parallel_comp': 32}, verbose=False)
+print("Model compiled to bandgap_rf.so")
@@ -0,0 +1,19 @@
+from numba import njit, prange
+
+# Random forest traversal over the packed arrays built in band_gap_prediction.
+# Kept in its own module so numba is only imported when the forest path is used.
+
+# No fastmath: NaN comparisons must stay well defined
+@njit(parallel=True, cache=True)
+def rf_predict(x, feat, thr, cl, cr, val):
+    n_trees = feat.shape[0]
+    acc = 0.0
+    for t in prange(n_trees):
+        node = 0
+        while cl[t, node] != -1:
+            if x[feat[t, node]] <= thr[t, node]:
+                node = cl[t, node]
+            else:
+                node = cr[t, node]
+        acc += val[t, node]
+    return acc / n_trees